@@ -1,89 +1,126 @@
 from flask import Flask, jsonify, send_from_directory
 import os
+import sys
 import time
+import logging
 from datetime import datetime
 import threading
-import queue
 import subprocess
 import shutil
 from flasgger import Swagger
+from scripts import uring
+from scripts.chunk_ring import ChunkRing
+from scripts.job_buffer import BufferPool
 
 # --- Flask App Setup ---
 app = Flask(__name__)
+# Behind a server that honours X-Sendfile (Apache mod_xsendfile, lighttpd),
+# let it send downloads straight from disk. Without one, send_file() hands
+# the file to the WSGI server's file wrapper, which uses sendfile() itself.
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 Swagger(app)
 
 # --- Directory and Device Configuration ---
 TXT_DIR = "/home/rasp/printer/txt"
 PRINTER_DEVICE = "/dev/g_printer0"
 PRINTS_DIR = "/home/rasp/printer/prints"
-CHUNK_SIZE = 4096
+BUF_SIZE = 4096  # bytes per read
+NUM_BUFS = 256  # read buffers shared with the kernel (1 MiB)
+RING_N = 64  # reader thread slots when io_uring is unavailable
 JOB_COMPLETION_TIMEOUT = 3.0  # seconds
+FILES_CACHE_TTL = 1.0  # seconds a /files listing is reused
 
 os.makedirs(PRINTS_DIR, exist_ok=True)
 os.makedirs(TXT_DIR, exist_ok=True)
 
-# --- Print Capture Logic (from capture_prints.py) ---
-data_queue = queue.Queue()
+log = logging.getLogger(__name__)
 
-def reader_thread(dev_path, q):
+# --- Print Capture Logic (from capture_prints.py) ---
+def reader_thread(dev_path, ring):
     """This function runs in a background thread and reads from the device."""
-    print("[INFO] Reader thread started.")
+    log.info("Reader thread started.")
     try:
-        with open(dev_path, 'rb') as dev:
+        # Unbuffered, so each readinto() returns after a single read.
+        with open(dev_path, 'rb', buffering=0) as dev:
             while True:
-                data = dev.read(CHUNK_SIZE)
-                if not data:
-                    print("[INFO] Reader thread received 0 bytes, exiting.")
+                n = dev.readinto(ring.reserve())
+                if not n:
+                    log.info("Reader thread received 0 bytes, exiting.")
                     break
-                q.put(data)
+                ring.commit(n)
     except Exception as e:
-        print(f"[ERROR] Reader thread encountered an error: {e}")
+        log.error(f"Reader thread encountered an error: {e}")
     finally:
-        q.put(None) # Signal that the reader is done.
+        ring.close() # Signal that the reader is done.
 
 def capture_prints_job():
     """Main logic to handle timeouts and save the buffer."""
-    buffer = bytearray()
+    pool = BufferPool() # job buffers, reused once a job is saved
+    buffer = pool.get()
     last_data_time = None
 
     def save_buffer():
-        nonlocal last_data_time
+        nonlocal buffer, last_data_time
         if buffer:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"{PRINTS_DIR}/print_{timestamp}.bin"
-            with open(filename, "wb") as f:
-                f.write(buffer)
-            print(f"[INFO] Print job saved: {filename} ({len(buffer)} bytes)")
-            buffer.clear()
-        last_data_time = None
-        print("\n[INFO] Ready for next print job...")
+            size = len(buffer)
+            job = buffer
 
-    # Start the reader thread
-    thread = threading.Thread(target=reader_thread, args=(PRINTER_DEVICE, data_queue), daemon=True)
-    thread.start()
+            def saved(error=None):
+                if error:
+                    log.error(f"Failed to save print job {filename}: {error}")
+                else:
+                    log.info(f"Print job saved: {filename} ({size} bytes)")
+                pool.put(job)
 
-    print("[INFO] Starting print capture...")
-    print("[INFO] Ready for next print job...")
+            # Write in the background through the capture ring if possible
+            if ring is None or not ring.write_file(filename, job.view(), saved):
+                with open(filename, "wb") as f:
+                    f.write(job.view())
+                saved()
+            buffer = pool.get() # the old one may still be being written
+        last_data_time = None
+        log.debug("Ready for next print job...")
 
-    while True:
-        try:
-            data = data_queue.get(timeout=1.0)
-            if data is None: # Sentinel value means thread is done
-                print("[INFO] Reader thread has finished.")
-                if buffer: save_buffer()
-                break # Exit main loop
+    try:
+        source = uring.PrinterRing(PRINTER_DEVICE, BUF_SIZE, NUM_BUFS, JOB_COMPLETION_TIMEOUT)
+        log.info("Starting print capture (io_uring)...")
+    except OSError as e:
+        log.warning(f"io_uring capture unavailable ({e}), using reader thread.")
+        source = ChunkRing(RING_N, BUF_SIZE, JOB_COMPLETION_TIMEOUT)
+        thread = threading.Thread(target=reader_thread, args=(PRINTER_DEVICE, source), daemon=True)
+        thread.start()
+        log.info("Starting print capture...")
+    ring = source if isinstance(source, uring.PrinterRing) else None
+    log.info("Ready for next print job...")
 
-            if not last_data_time:
-                print("[INFO] Print job started.")
-            buffer.extend(data)
-            last_data_time = time.time()
+    with source:
+        while True:
+            try:
+                chunks = source.poll() # Blocks until data or the job goes idle
+            except OSError as e: # e.g. the host unplugged mid-job
+                log.error(f"Reading printer device failed: {e}")
+                if buffer: save_buffer()
+                break
+            if chunks is None: # Device closed or reader thread done
+                log.info("Printer capture has finished.")
+                if buffer: save_buffer()
+                break
 
-        except queue.Empty:
-            if last_data_time and (time.time() - last_data_time > JOB_COMPLETION_TIMEOUT):
-                print(f"[INFO] Job completion timeout ({JOB_COMPLETION_TIMEOUT}s) reached.")
+            if chunks:
+                if not last_data_time:
+                    log.info("Print job started.")
+                for chunk in chunks:
+                    buffer.extend(chunk)
+                last_data_time = time.time()
+            else:
+                log.debug(f"Job completion timeout ({JOB_COMPLETION_TIMEOUT}s) reached.")
                 save_buffer()
 
 # --- Flask API Endpoints ---
+_files_cache = (0.0, None) # (monotonic time listed, files)
+
 @app.route('/files', methods=['GET'])
 def list_files():
     """List all available TXT files.
@@ -101,16 +138,21 @@ def list_files():
               size:
                 type: integer
     """
+    global _files_cache
+    listed_at, files = _files_cache
+    now = time.monotonic()
+    # The directory only changes when a print completes
+    if files is not None and now - listed_at < FILES_CACHE_TTL:
+        return jsonify(files)
     if not os.path.exists(TXT_DIR):
         return jsonify({"error": "TXT directory not found"}), 404
     try:
-        files_with_sizes = []
-        for f in os.listdir(TXT_DIR):
-            if f.endswith('.txt'):
-                file_path = os.path.join(TXT_DIR, f)
-                size = os.path.getsize(file_path)
-                files_with_sizes.append({"name": f, "size": size})
-        return jsonify(files_with_sizes)
+        # File types come with the directory listing, so only sizes need a stat()
+        with os.scandir(TXT_DIR) as it:
+            files = [{"name": e.name, "size": e.stat().st_size}
+                     for e in it if e.is_file() and e.name.endswith('.txt')]
+        _files_cache = (now, files)
+        return jsonify(files)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -132,13 +174,41 @@ def download_file(filename):
     """
     return send_from_directory(TXT_DIR, filename, as_attachment=True)
 
-if __name__ == '__main__':
-    # Start the print capture job in a background thread
-    print("[INFO] Starting background print capture thread.")
+def start_capture():
+    """Start the print capture job in a background thread."""
+    # Same "[LEVEL] message" lines as before, on stdout
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s", stream=sys.stdout)
+    log.info("Starting background print capture thread.")
     capture_thread = threading.Thread(target=capture_prints_job, daemon=True)
     capture_thread.start()
-    
-    # Start the Flask server
-    # Note: Disabling debug mode is recommended for stability when using threads.
-    # The reloader can cause issues with background threads.
-    app.run(host='0.0.0.0', port=5000, debug=False)
+
+def run_gunicorn():
+    """Serve with gunicorn's threaded workers; returns False if it isn't installed."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        return False
+
+    class Server(BaseApplication):
+        def load_config(self):
+            # One worker, since only one process can capture from the
+            # printer; its threads serve downloads alongside the capture.
+            self.cfg.set('bind', '0.0.0.0:5000')
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', 4)
+            self.cfg.set('post_worker_init', lambda worker: start_capture())
+
+        def load(self):
+            return app
+
+    Server().run()
+    return True
+
+if __name__ == '__main__':
+    if not run_gunicorn():
+        start_capture()
+        # Start the Flask server
+        # Note: Disabling debug mode is recommended for stability when using threads.
+        # The reloader can cause issues with background threads.
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
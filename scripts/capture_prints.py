@@ -2,181 +2,187 @@
 import os
 import sys
 import time
+import logging
 from datetime import datetime
 import threading
-import queue
-import subprocess
-from pathlib import Path
+
+import uring
+from extract_string import process_file_bytes
+from chunk_ring import ChunkRing
+from job_buffer import BufferPool
 
 PRINTER_DEVICE = "/dev/g_printer0"
 OUTPUT_DIR = "/home/rasp/printer/prints"
-CHUNK_SIZE = 4096
+BUF_SIZE = 4096  # bytes per read
+NUM_BUFS = 256  # read buffers shared with the kernel (1 MiB)
+RING_N = 64  # reader thread slots when io_uring is unavailable
 # How long to wait for new data before considering the job finished.
 JOB_COMPLETION_TIMEOUT = 3.0  # seconds
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# A queue to safely pass data from the reader thread to the main thread
-data_queue = queue.Queue()
+log = logging.getLogger(__name__)
+# Per-chunk progress is logged at debug level once every this many chunks.
+LOG_EVERY_CHUNKS = 100
+
+# Job buffers, reused once a job is saved instead of regrown for every job
+_job_pool = BufferPool()
 
-def reader_thread(dev_path, q):
+def reader_thread(dev_path, ring):
     """This function runs in a background thread and reads from the device."""
-    print("[INFO] Reader thread started.")
+    log.info("Reader thread started.")
     try:
-        with open(dev_path, 'rb') as dev:
+        # Unbuffered, so each readinto() returns after a single read.
+        with open(dev_path, 'rb', buffering=0) as dev:
             while True:
-                data = dev.read(CHUNK_SIZE)
-                if not data:
+                n = dev.readinto(ring.reserve())
+                if not n:
                     # This might indicate the host closed the connection.
-                    print("[INFO] Reader thread received 0 bytes, exiting.")
+                    log.info("Reader thread received 0 bytes, exiting.")
                     break
-                q.put(data)
+                # Lock-free hand-off to the main thread
+                ring.commit(n)
     except Exception as e:
-        print(f"[ERROR] Reader thread encountered an error: {e}")
+        log.error(f"Reader thread encountered an error: {e}")
     finally:
         # Signal that the reader is done.
-        q.put(None)
+        ring.close()
+
+def report_saved(filename, size, error=None):
+    """Log the outcome of writing a print job and check the file on disk."""
+    if error:
+        log.error(f"Failed to save print job {filename}: {error}")
+    else:
+        log.info(f"Print job saved: {filename} ({size} bytes)")
+    # Verify the file was created and has content
+    if os.path.exists(filename):
+        size = os.path.getsize(filename)
+        log.debug(f"File {filename} exists, size: {size} bytes")
+    else:
+        log.error(f"File {filename} was not created")
 
-def save_buffer(buffer):
-    """Save the buffer to a file and process it."""
+def save_buffer(buffer, ring=None):
+    """
+    Save the job buffer to a file and process it.
+
+    With an io_uring `ring` the file is written in the background while
+    the text is extracted. Either way `buffer` goes back to the pool once
+    it has been written, so the caller must not reuse it.
+    """
     if not buffer:
-        print("[DEBUG] Empty buffer, nothing to save")
+        log.debug("Empty buffer, nothing to save")
         return
         
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = os.path.join(OUTPUT_DIR, f"print_{timestamp}.bin")
+    size = len(buffer)
+    data = buffer.view()
+    background = False
+
+    def written(error):
+        report_saved(filename, size, error)
+        _job_pool.put(buffer)
     
     try:
         # Save the raw buffer to file
-        print(f"[DEBUG] Saving buffer to {filename}")
-        with open(filename, "wb") as f:
-            f.write(buffer)
-        print(f"[INFO] Print job saved: {filename} ({len(buffer)} bytes)")
-        
-        # Call extract_string.py to process the file
-        extract_script = Path(__file__).parent.absolute() / 'extract_string.py'
-        if not extract_script.exists():
-            print(f"[ERROR] extract_string.py not found at {extract_script}")
-            return
-            
-        # Print current working directory and script path for debugging
-        print(f"[DEBUG] Current working directory: {os.getcwd()}")
-        print(f"[DEBUG] Using extract script: {extract_script}")
-        
-        # Build absolute path to the binary file
-        abs_filename = os.path.abspath(filename)
-        print(f"[DEBUG] Processing file: {abs_filename}")
+        if ring is not None and ring.write_file(filename, data, written):
+            background = True
+            log.debug(f"Writing buffer to {filename} in the background")
+        else:
+            log.debug(f"Saving buffer to {filename}")
+            with open(filename, "wb") as f:
+                f.write(data)
+            report_saved(filename, size)
         
-        # Run the script with full paths
-        cmd = [sys.executable, str(extract_script), abs_filename]
-        print(f"[DEBUG] Executing: {' '.join(cmd)}")
+        # Extract from the captured bytes; the .bin is never read back
+        log.debug("Extraction started")
+        result = process_file_bytes(data)
         
-        # Run with Popen to capture all output in real-time
-        try:
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
-            
-            # Stream the output in real-time
-            print("\n=== EXTRACTION STARTED ===")
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    print(output.strip())
-            
-            # Get any remaining output after process ends
-            stdout, stderr = process.communicate()
-            
-            if stdout:
-                print("\n=== EXTRACTED CONTENT ===")
-                print(stdout.strip())
-                print("=========================\n")
-                
-            if stderr:
-                print("\n=== ERRORS ===")
-                print(stderr.strip())
-                print("==============\n")
-                
-            if process.returncode != 0:
-                print(f"[ERROR] Script failed with return code {process.returncode}")
-            
-        except Exception as e:
-            print(f"[ERROR] Failed to execute extract_string.py: {e}")
-            import traceback
-            traceback.print_exc()
+        log.info(f"Extracted content:\n{result.strip()}")
             
     except Exception as e:
-        print(f"[ERROR] Error processing print job: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception(f"Error processing print job: {e}")
     finally:
-        # Verify the file was created and has content
-        if os.path.exists(filename):
-            size = os.path.getsize(filename)
-            print(f"[DEBUG] File {filename} exists, size: {size} bytes")
-        else:
-            print(f"[ERROR] File {filename} was not created")
+        if not background:
+            _job_pool.put(buffer)
 
-def main():
-    """Main logic to handle timeouts and save the buffer."""
-    buffer = bytearray()
+def capture(source):
+    """Collect chunks from `source` into print jobs, saving each once it goes idle."""
+    buffer = _job_pool.get()
     last_data_time = None
-    
-    # Start the reader thread
-    thread = threading.Thread(target=reader_thread, args=(PRINTER_DEVICE, data_queue), daemon=True)
-    thread.start()
+    # Saved jobs are written through the capture ring when there is one.
+    ring = source if isinstance(source, uring.PrinterRing) else None
+    chunk_count, next_log = 0, LOG_EVERY_CHUNKS
 
-    print("[INFO] Starting print capture...")
-    print("[INFO] Ready for next print job...")
+    log.info("Ready for next print job...")
 
     while True:
         try:
-            # Get data from the queue, with a timeout.
-            data = data_queue.get(timeout=1.0)
+            # Wait for data; an empty list means the job went idle.
+            chunks = source.poll()
 
-            if data is None:  # Sentinel value means thread is done
-                print("[INFO] Reader thread has finished.")
+            if chunks is None:  # Device closed or reader thread done
+                log.info("Printer capture has finished.")
                 if buffer:
-                    save_buffer(buffer)
+                    save_buffer(buffer, ring)
                 break
-                
-            # We got data, so extend the buffer and update the timestamp
-            if not last_data_time:
-                print("[INFO] Print job started.")
-            buffer.extend(data)
-            last_data_time = time.time()
-            print(f"[INFO] Read {len(data)} bytes, buffer size: {len(buffer)}")
-            
-        except queue.Empty:
-            # Check for job completion timeout
-            if buffer and last_data_time and (time.time() - last_data_time > JOB_COMPLETION_TIMEOUT):
-                print("\n[INFO] Job completion timeout reached.")
-                save_buffer(buffer)
-                buffer = bytearray()
+
+            if chunks:
+                # We got data, so extend the buffer and update the timestamp
+                if not last_data_time:
+                    log.info("Print job started.")
+                for data in chunks:
+                    buffer.extend(data)
+                chunk_count += len(chunks)
+                if chunk_count >= next_log:
+                    log.debug("Read %d chunks, buffer size: %d", chunk_count, len(buffer))
+                    next_log += LOG_EVERY_CHUNKS
+                last_data_time = time.time()
+
+            elif buffer:
+                log.debug("Job completion timeout reached.")
+                save_buffer(buffer, ring)
+                buffer = _job_pool.get()
                 last_data_time = None
-                print("\n[INFO] Ready for next print job...")
-                
+                chunk_count, next_log = 0, LOG_EVERY_CHUNKS
+                log.debug("Ready for next print job...")
+
         except KeyboardInterrupt:
-            print("\n[INFO] Shutting down...")
+            log.info("Shutting down...")
             if buffer:
-                save_buffer(buffer)
+                save_buffer(buffer, ring)
             break
-            
+
+        except OSError as e:
+            log.error(f"Reading printer device failed: {e}")
+            if buffer:
+                save_buffer(buffer, ring)
+            break
+
         except Exception as e:
-            print(f"[ERROR] Error in main loop: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception(f"Error in main loop: {e}")
             time.sleep(1)  # Prevent tight loop on error
 
+def main():
+    """Main logic to handle timeouts and save the buffer."""
+    # Same "[LEVEL] message" lines as before, on stdout
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s", stream=sys.stdout)
+    try:
+        source = uring.PrinterRing(PRINTER_DEVICE, BUF_SIZE, NUM_BUFS, JOB_COMPLETION_TIMEOUT)
+        log.info("Starting print capture (io_uring)...")
+    except OSError as e:
+        log.warning(f"io_uring capture unavailable ({e}), using reader thread.")
+        source = ChunkRing(RING_N, BUF_SIZE, JOB_COMPLETION_TIMEOUT)
+        # Start the reader thread
+        thread = threading.Thread(target=reader_thread, args=(PRINTER_DEVICE, source), daemon=True)
+        thread.start()
+        log.info("Starting print capture...")
+
+    with source:
+        capture(source)
+
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("\n[INFO] Stopping capture by user.")
+        log.info("Stopping capture by user.")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Single-producer/single-consumer ring for handing printer data from the
+reader thread to the capture loop, used when io_uring is unavailable.
+Only the reader thread moves `head` and only the capture loop moves `tail`,
+so neither side takes a lock; an eventfd wakes whichever side is waiting.
+Slots are preallocated and read into in place, so no bytes object is
+created per chunk.
+"""
+import os
+import select
+import time
+
+
+class ChunkRing:
+    """
+    Ring of `size` slots of `slot_size` bytes with the same poll() contract
+    as uring.PrinterRing.
+
+    `size` must be a power of two.
+    """
+
+    def __init__(self, size=64, slot_size=4096, idle_timeout=3.0):
+        self._slots = [memoryview(bytearray(slot_size)) for _ in range(size)]
+        self._lengths = [0] * size
+        self._mask = size - 1
+        self.head = 0  # next slot the producer fills
+        self.tail = 0  # oldest slot the consumer still holds
+        self._handed = 0  # slots before this were returned by the last poll()
+        self.closed = False
+        self.idle_timeout = idle_timeout
+        self._in_job = False
+        self._producer_waiting = False
+        self._consumer_waiting = False
+        self._producer_done = False
+        self._data_fd = os.eventfd(0, os.EFD_CLOEXEC)
+        self._space_fd = os.eventfd(0, os.EFD_CLOEXEC)
+
+    # --- Producer side (reader thread) ---
+    def reserve(self):
+        """Return the next free slot to read into, waiting for one if the ring is full."""
+        while self.head - self.tail > self._mask:
+            self._producer_waiting = True
+            if self.head - self.tail > self._mask:  # re-check after announcing
+                os.eventfd_read(self._space_fd)
+            self._producer_waiting = False
+        return self._slots[self.head & self._mask]
+
+    def commit(self, length):
+        """Publish the first `length` bytes of the reserved slot."""
+        self._lengths[self.head & self._mask] = length
+        self.head += 1
+        if self._consumer_waiting:  # otherwise the next poll() sees the new head
+            os.eventfd_write(self._data_fd, 1)
+
+    def close(self):
+        """Signal that no more data will be put."""
+        self.closed = True
+        os.eventfd_write(self._data_fd, 1)
+        self._producer_done = True
+
+    # --- Consumer side (capture loop) ---
+    def poll(self):
+        """
+        Wait for printer data.
+
+        Returns a list of memoryviews (valid until the next call), an empty
+        list once no data has arrived for `idle_timeout` seconds during a job,
+        or None once the producer closed.
+        """
+        # Chunks from the previous call are done with; free their slots.
+        if self.tail != self._handed:
+            self.tail = self._handed
+            if self._producer_waiting:
+                os.eventfd_write(self._space_fd, 1)
+
+        deadline = time.monotonic() + self.idle_timeout if self._in_job else None
+        while True:
+            closed = self.closed  # read before head so a final put isn't missed
+            if self.tail != self.head:
+                break
+            if closed:
+                return None
+            self._consumer_waiting = True
+            if self.tail == self.head and not self.closed:  # re-check after announcing
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                ready, _, _ = select.select([self._data_fd], [], [], timeout)
+                if not ready:
+                    self._consumer_waiting = False
+                    self._in_job = False
+                    return []
+                os.eventfd_read(self._data_fd)
+            self._consumer_waiting = False
+
+        chunks = []
+        head = self.head
+        for n in range(self.tail, head):
+            i = n & self._mask
+            chunks.append(self._slots[i][:self._lengths[i]])
+        self._handed = head
+        self._in_job = True
+        return chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # A reader thread still blocked in read() may write to these later.
+        if self._producer_done:
+            os.close(self._data_fd)
+            os.close(self._space_fd)
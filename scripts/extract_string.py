@@ -1,166 +1,154 @@
 #!/usr/bin/env python3
 import sys
+import os
 import re
+import mmap
+from contextlib import contextmanager
 from pathlib import Path
 
-def detect_format(file_path):
+# Printable ASCII plus newline and tab; every other byte is dropped in one
+# bytes.translate() pass instead of a per-character regex.
+_PRINTABLE = bytes(range(0x20, 0x7F)) + b'\n\t'
+_NONPRINTABLE = bytes(b for b in range(256) if b not in _PRINTABLE)
+# Slice size for translating (possibly mapped) data without copying it all at once
+_MAP_CHUNK = 64 * 1024
+
+# Text inside a PostScript string literal, honouring backslash escapes and
+# one level of balanced parentheses, e.g. (Version 15.5 (Build 24F74))
+_PAREN_RE = re.compile(rb'\(((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*)\)', re.DOTALL)
+
+# Common PostScript text patterns, as one alternation so the content is
+# scanned once; the named group that matched holds the text
+_PS_TEXT_RE = re.compile(rb"""
+    # Text in text blocks, including text right after TF/TJ
+    \b(?:T[FJ]|BT|ET)\b.*?\((?P<block>[^)]+)\)
+    # Text before text operators
+  | (?P<before>\b\([^)]+\)\s*T[FJ])
+    # Text in show operators
+  | (?P<show>\b\([^)]+\)\s+show\b)
+""", re.DOTALL | re.VERBOSE)
+
+# Backslash escapes of parentheses and backslashes inside a string literal
+_PS_UNESCAPE_RE = re.compile(rb'\\([()\\])')
+
+# Common ESC/POS control codes to remove
+ESCPOS_CODES = [
+    b'\x1b@',    # Initialize printer
+    b'\x1b!',    # Select print mode
+    b'\x1b-',    # Underline mode
+    b'\x1bE',    # Bold on
+    b'\x1bF',    # Bold off
+    b'\x1bM',    # Font A
+    b'\x1bP',    # 10 cpi font
+    b'\x1b!\x00', # Normal text
+]
+# All of the above in one pass; earlier codes win, as with sequential replaces
+_ESCPOS_RE = re.compile(b'|'.join(re.escape(code) for code in ESCPOS_CODES))
+
+@contextmanager
+def _mapped(file_path):
+    """Map a file read-only so it can be scanned without reading it into memory."""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''  # empty files can't be mapped
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+def detect_format(data):
     """
-    Detect the format of printer data file.
+    Detect the format of printer data.
     
     Args:
-        file_path (str): Path to the input file
+        data (bytes-like): Captured printer data
         
     Returns:
         str: Detected format ('escpos', 'postscript', or 'rawtext')
     """
     try:
-        with open(file_path, 'rb') as f:
-            # Read first 1024 bytes for analysis
-            header = f.read(1024)
+        # Use the first 1024 bytes for analysis
+        header = bytes(data[:1024])
+        
+        # Check for PostScript (starts with %!PS)
+        if header.startswith(b'%!PS') or b'%!PS' in header:
+            return 'postscript'
             
-            # Check for PostScript (starts with %!PS)
-            if header.startswith(b'%!PS') or b'%!PS' in header:
-                return 'postscript'
-                
-            # Check for ESC/POS commands (ESC @, ESC !, etc.)
-            if b'\x1b' in header:  # ESC character
-                return 'escpos'
-                
-            # Default to raw text if no specific format detected
-            return 'rawtext'
+        # Check for ESC/POS commands (ESC @, ESC !, etc.)
+        if b'\x1b' in header:  # ESC character
+            return 'escpos'
             
+        # Default to raw text if no specific format detected
+        return 'rawtext'
+        
     except Exception as e:
         print(f"[ERROR] Format detection failed: {e}")
         return 'rawtext'  # Default to raw text on error
 
-def convert_escpos(file_path):
+def convert_escpos(data):
     """Convert ESC/POS binary data to readable text."""
     try:
-        with open(file_path, 'rb') as f:
-            content = f.read().decode('latin-1')
-        
-        # Common ESC/POS control codes to remove
-        escpos_codes = [
-            '\x1b@',    # Initialize printer
-            '\x1b!',    # Select print mode
-            '\x1b-',    # Underline mode
-            '\x1bE',    # Bold on
-            '\x1bF',    # Bold off
-            '\x1bM',    # Font A
-            '\x1bP',    # 10 cpi font
-            '\x1b!\x00', # Normal text
-        ]
-        
-        cleaned = content
-        for code in escpos_codes:
-            cleaned = cleaned.replace(code, '')
+        cleaned = _ESCPOS_RE.sub(b'', data)
         
         # Remove other non-printable characters except newlines and tabs
-        cleaned = re.sub(r'[^\x20-\x7E\n\t]', '', cleaned)
-        return cleaned.strip()
+        cleaned = cleaned.translate(None, _NONPRINTABLE)
+        return cleaned.decode('ascii').strip()
         
     except Exception as e:
         return f"Error converting ESC/POS: {str(e)}"
 
-def convert_postscript(file_path):
+def convert_postscript(data):
     """Convert PostScript data to readable text."""
     try:
-        with open(file_path, 'rb') as f:
-            content = f.read().decode('latin-1', errors='replace')
-        
-        # Look for text in common PostScript patterns
-        patterns = [
-            # Text in parentheses after text operators
-            (r'\bT[FJ]\s*\(([^)]+)\)', 1),
-            # Text before text operators
-            (r'\b\([^)]+\)\s*T[FJ]', 1),
-            # Text in text blocks
-            (r'\b(?:T[FJ]|BT|ET)\b.*?\(([^)]+)\)', 1),
-            # Another variation of text blocks
-            (r'\b(?:T[FJ]|BT|ET)\b[^()]*\(([^)]+)\)', 1),
-            # Text in show operators
-            (r'\b\([^)]+\)\s+show\b', 1),
-            # Text in string literals
-            (r'\([^\\()]*(?:\\.[^\\()]*)*\)', 0),
-        ]
+        # Any text between parentheses (string literals), then text found
+        # around text operators, in a single pass each
+        candidates = _PAREN_RE.findall(data)
+        candidates += [m.group(m.lastgroup) for m in _PS_TEXT_RE.finditer(data)]
         
-        # Also try to extract any text between parentheses as a last resort
         all_text = []
-        in_text = False
-        current_text = []
-        
-        for char in content:
-            if char == '(' and not in_text:
-                in_text = True
-                current_text = []
-            elif char == ')' and in_text:
-                in_text = False
-                if current_text:
-                    text = ''.join(current_text).strip()
-                    if len(text) > 3:  # Only keep meaningful text
-                        all_text.append(text)
-            elif in_text:
-                current_text.append(char)
-        
-        # Now try the regex patterns
-        for pattern, group in patterns:
-            try:
-                matches = re.findall(pattern, content, re.DOTALL)
-                for match in matches:
-                    if isinstance(match, tuple):
-                        text = match[group] if group < len(match) else ''
-                    else:
-                        text = match
-                    
-                    # Clean up the text
-                    text = text.strip()
-                    if text and len(text) > 3:  # Only keep meaningful text
-                        # Remove escape sequences
-                        text = re.sub(r'\\([()\\])', r'\1', text)
-                        all_text.append(text)
-            except Exception as e:
-                print(f"[WARN] Error processing pattern {pattern}: {e}")
+        for text in candidates:
+            # Clean up the text
+            text = text.strip()
+            if len(text) > 3:  # Only keep meaningful text
+                # Remove escape sequences
+                text = _PS_UNESCAPE_RE.sub(rb'\1', text)
+                all_text.append(text.decode('latin-1'))
         
         # Remove duplicates while preserving order
-        seen = set()
-        unique_text = []
-        for text in all_text:
-            if text not in seen:
-                seen.add(text)
-                unique_text.append(text)
+        unique_text = list(dict.fromkeys(all_text))
         
         return '\n'.join(unique_text) if unique_text else "No text content found in PostScript data."
         
     except Exception as e:
         return f"Error converting PostScript: {str(e)}"
 
-def convert_rawtext(file_path):
+def convert_rawtext(data):
     """Convert raw text data to clean text."""
     try:
-        # Try UTF-8 first, fall back to Latin-1 if that fails
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            with open(file_path, 'r', encoding='latin-1') as f:
-                content = f.read()
-        
-        # Remove non-printable characters except newlines and tabs
-        cleaned = re.sub(r'[^\x20-\x7E\n\t]', '', content)
-        return cleaned.strip()
+        # Normalise line endings the way text mode did, then remove
+        # non-printable characters except newlines and tabs, a slice at a
+        # time. Non-ASCII bytes are dropped too, so there is nothing to
+        # decode first.
+        pieces = []
+        start, size = 0, len(data)
+        while start < size:
+            end = min(start + _MAP_CHUNK, size)
+            if data[end - 1:end + 1] == b'\r\n':
+                end += 1  # don't split a CRLF across slices
+            piece = bytes(data[start:end]).replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+            pieces.append(piece.translate(None, _NONPRINTABLE))
+            start = end
+        return b''.join(pieces).decode('ascii').strip()
         
     except Exception as e:
         return f"Error converting raw text: {str(e)}"
 
-def process_file(file_path):
+def process_file_bytes(data):
     """
-    Process the input file based on its detected format.
+    Convert captured printer data based on its detected format.
     Uses a switch-case like pattern to call the appropriate converter.
     """
-    print(f"\n[INFO] Processing file: {file_path}")
-    
-    # Detect the file format
-    file_format = detect_format(file_path)
+    # Detect the data format
+    file_format = detect_format(data)
     print(f"[INFO] Detected format: {file_format}")
     
     # Switch-case equivalent using a dictionary
@@ -175,7 +163,7 @@ def process_file(file_path):
     print(f"[INFO] Using converter: {converter.__name__}")
     
     try:
-        result = converter(file_path)
+        result = converter(data)
         print(f"[INFO] Conversion completed successfully")
         return result
     except Exception as e:
@@ -185,6 +173,17 @@ def process_file(file_path):
         traceback.print_exc()
         return error_msg
 
+def process_file(file_path):
+    """Process a saved .bin file, scanning it through a read-only mapping."""
+    print(f"\n[INFO] Processing file: {file_path}")
+    try:
+        with _mapped(file_path) as data:
+            return process_file_bytes(data)
+    except OSError as e:
+        error_msg = f"[ERROR] Conversion failed: {str(e)}"
+        print(error_msg)
+        return error_msg
+
 if __name__ == "__main__":
     if len(sys.argv) != 2:
         print("Usage: python3 extract_string.py <path_to_bin_file>")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Reusable buffers for collecting print jobs.
+A bytearray gives its memory back as soon as it is emptied, so every job
+used to regrow one chunk at a time. JobBuffer tracks its own length over a
+bytearray that only ever grows, and BufferPool hands the buffers out again
+once a job has been saved, so steady-state capture allocates nothing.
+"""
+from collections import deque
+
+# Initial capacity; buffers grow to the largest job seen and stay that size.
+JOB_BUFFER_SIZE = 1 << 20
+
+
+class JobBuffer:
+    """Byte buffer that keeps its allocation when cleared."""
+
+    def __init__(self, size=JOB_BUFFER_SIZE):
+        self._data = bytearray(size)
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def extend(self, chunk):
+        end = self._length + len(chunk)
+        if end > len(self._data):
+            self._data.extend(bytes(max(end, 2 * len(self._data)) - len(self._data)))
+        self._data[self._length:end] = chunk  # same-size slice, no resize
+        self._length = end
+
+    def view(self):
+        """Writable view of the data collected so far."""
+        return memoryview(self._data)[:self._length]
+
+    def clear(self):
+        self._length = 0
+
+
+class BufferPool:
+    """First-in, first-out pool of JobBuffers; more are made if it runs dry."""
+
+    def __init__(self, count=2, size=JOB_BUFFER_SIZE):
+        self._size = size
+        self._free = deque(JobBuffer(size) for _ in range(count))
+
+    def get(self):
+        return self._free.popleft() if self._free else JobBuffer(self._size)
+
+    def put(self, buffer):
+        """Return a buffer once nothing reads from it any more."""
+        buffer.clear()
+        self._free.append(buffer)
@@ -0,0 +1,804 @@
+#!/usr/bin/env python3
+"""
+Minimal io_uring support for capturing printer data.
+Talks to the kernel directly through ctypes so no extra packages are needed on
+the Raspberry Pi. Only the handful of operations the capture loop uses are
+implemented.
+"""
+import ctypes
+import ctypes.util
+import errno
+import mmap
+import os
+import platform
+import stat
+
+# --- Kernel ABI (include/uapi/linux/io_uring.h) ---
+# The io_uring syscall numbers are shared by every architecture.
+_NR_IO_URING_SETUP = 425
+_NR_IO_URING_ENTER = 426
+_NR_IO_URING_REGISTER = 427
+
+# Provided buffer rings landed in 5.19; multishot reads (6.7) are probed for.
+MIN_KERNEL = (5, 19)
+
+# Queued SQEs are only pushed to the kernel once this many pile up, or when
+# the capture loop is about to wait anyway.
+BATCH_SIZE = 64
+
+# Saved print jobs written in the background at once; beyond this the
+# caller writes synchronously.
+MAX_WRITES = 4
+
+IORING_SETUP_IOPOLL = 1 << 0
+IORING_SETUP_SQPOLL = 1 << 1
+IORING_SETUP_CQSIZE = 1 << 3
+
+IORING_OFF_SQ_RING = 0
+IORING_OFF_CQ_RING = 0x8000000
+IORING_OFF_SQES = 0x10000000
+
+IORING_FEAT_SINGLE_MMAP = 1 << 0
+IORING_FEAT_EXT_ARG = 1 << 8
+
+IORING_ENTER_GETEVENTS = 1 << 0
+IORING_ENTER_SQ_WAKEUP = 1 << 1
+IORING_ENTER_SQ_WAIT = 1 << 2
+IORING_ENTER_EXT_ARG = 1 << 3
+IORING_ENTER_REGISTERED_RING = 1 << 4
+
+IORING_SQ_NEED_WAKEUP = 1 << 0
+
+IOSQE_FIXED_FILE = 1 << 0
+IOSQE_BUFFER_SELECT = 1 << 5
+
+IORING_CQE_F_BUFFER = 1 << 0
+IORING_CQE_F_MORE = 1 << 1
+IORING_CQE_BUFFER_SHIFT = 16
+
+IORING_OP_TIMEOUT = 11
+IORING_OP_TIMEOUT_REMOVE = 12
+IORING_OP_ASYNC_CANCEL = 14
+IORING_OP_READ = 22
+IORING_OP_WRITE = 23
+IORING_OP_READ_MULTISHOT = 49
+
+IORING_REGISTER_FILES = 2
+IORING_REGISTER_PROBE = 8
+IORING_REGISTER_RING_FDS = 20
+IORING_UNREGISTER_RING_FDS = 21
+IORING_REGISTER_PBUF_RING = 22
+
+_U32 = 0xFFFFFFFF
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.syscall.restype = ctypes.c_long
+
+
+# --- Memory ordering ---
+# The kernel publishes ring indices with smp_store_release() and reads ours
+# with smp_load_acquire(), so our side needs the same ordering. Plain ctypes
+# accesses are fine on x86, which orders them in hardware, but not on the
+# Pi's weakly ordered ARM. libatomic's out-of-line atomics give acquire and
+# release accesses without compiling anything.
+_ATOMIC_ACQUIRE = 2
+_ATOMIC_RELEASE = 3
+_ATOMIC_SEQ_CST = 5
+
+_X86 = platform.machine().lower() in ("x86_64", "amd64", "i386", "i686")
+
+
+def _load_libatomic():
+    name = ctypes.util.find_library("atomic")
+    if not name:
+        return None
+    lib = ctypes.CDLL(name)
+    load = getattr(lib, "__atomic_load_4")
+    load.argtypes, load.restype = [ctypes.c_void_p, ctypes.c_int], ctypes.c_uint32
+    store = getattr(lib, "__atomic_store_4")
+    store.argtypes, store.restype = [ctypes.c_void_p, ctypes.c_uint32, ctypes.c_int], None
+    store_2 = getattr(lib, "__atomic_store_2")  # provided buffer ring tail
+    store_2.argtypes, store_2.restype = [ctypes.c_void_p, ctypes.c_uint16, ctypes.c_int], None
+    return {4: (load, store), 2: (None, store_2)}
+
+
+_atomics = _load_libatomic()
+
+
+def _load_acquire(var, order=_ATOMIC_ACQUIRE):
+    """Read a ctypes integer shared with the kernel."""
+    if _atomics is None:
+        return var.value
+    return _atomics[ctypes.sizeof(var)][0](ctypes.addressof(var), order)
+
+
+def _store_release(var, value, order=_ATOMIC_RELEASE):
+    """Write a ctypes integer shared with the kernel, after everything before it."""
+    if _atomics is None:
+        var.value = value
+    else:
+        _atomics[ctypes.sizeof(var)][1](ctypes.addressof(var), value, order)
+
+
+def _syscall(nr, *args):
+    ret = _libc.syscall(ctypes.c_long(nr), *(ctypes.c_long(a) for a in args))
+    if ret < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return ret
+
+
+class _SQRingOffsets(ctypes.Structure):
+    _fields_ = [
+        ("head", ctypes.c_uint32),
+        ("tail", ctypes.c_uint32),
+        ("ring_mask", ctypes.c_uint32),
+        ("ring_entries", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("dropped", ctypes.c_uint32),
+        ("array", ctypes.c_uint32),
+        ("resv1", ctypes.c_uint32),
+        ("user_addr", ctypes.c_uint64),
+    ]
+
+
+class _CQRingOffsets(ctypes.Structure):
+    _fields_ = [
+        ("head", ctypes.c_uint32),
+        ("tail", ctypes.c_uint32),
+        ("ring_mask", ctypes.c_uint32),
+        ("ring_entries", ctypes.c_uint32),
+        ("overflow", ctypes.c_uint32),
+        ("cqes", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("resv1", ctypes.c_uint32),
+        ("user_addr", ctypes.c_uint64),
+    ]
+
+
+class _Params(ctypes.Structure):
+    _fields_ = [
+        ("sq_entries", ctypes.c_uint32),
+        ("cq_entries", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("sq_thread_cpu", ctypes.c_uint32),
+        ("sq_thread_idle", ctypes.c_uint32),
+        ("features", ctypes.c_uint32),
+        ("wq_fd", ctypes.c_uint32),
+        ("resv", ctypes.c_uint32 * 3),
+        ("sq_off", _SQRingOffsets),
+        ("cq_off", _CQRingOffsets),
+    ]
+
+
+class _SQE(ctypes.Structure):
+    _fields_ = [
+        ("opcode", ctypes.c_uint8),
+        ("flags", ctypes.c_uint8),
+        ("ioprio", ctypes.c_uint16),
+        ("fd", ctypes.c_int32),
+        ("off", ctypes.c_uint64),
+        ("addr", ctypes.c_uint64),
+        ("len", ctypes.c_uint32),
+        ("op_flags", ctypes.c_uint32),
+        ("user_data", ctypes.c_uint64),
+        ("buf_index", ctypes.c_uint16),  # also buf_group
+        ("personality", ctypes.c_uint16),
+        ("file_index", ctypes.c_uint32),
+        ("addr3", ctypes.c_uint64),
+        ("pad", ctypes.c_uint64),
+    ]
+
+
+class _CQE(ctypes.Structure):
+    _fields_ = [
+        ("user_data", ctypes.c_uint64),
+        ("res", ctypes.c_int32),
+        ("flags", ctypes.c_uint32),
+    ]
+
+
+class _ProbeOp(ctypes.Structure):
+    _fields_ = [
+        ("op", ctypes.c_uint8),
+        ("resv", ctypes.c_uint8),
+        ("flags", ctypes.c_uint16),
+        ("resv2", ctypes.c_uint32),
+    ]
+
+
+class _Probe(ctypes.Structure):
+    _fields_ = [
+        ("last_op", ctypes.c_uint8),
+        ("ops_len", ctypes.c_uint8),
+        ("resv", ctypes.c_uint16),
+        ("resv2", ctypes.c_uint32 * 3),
+        ("ops", _ProbeOp * 256),
+    ]
+
+
+_IO_URING_OP_SUPPORTED = 1 << 0
+
+
+class _RsrcUpdate(ctypes.Structure):
+    _fields_ = [
+        ("offset", ctypes.c_uint32),
+        ("resv", ctypes.c_uint32),
+        ("data", ctypes.c_uint64),
+    ]
+
+
+class _KernelTimespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_int64), ("tv_nsec", ctypes.c_int64)]
+
+
+class _GeteventsArg(ctypes.Structure):
+    _fields_ = [
+        ("sigmask", ctypes.c_uint64),
+        ("sigmask_sz", ctypes.c_uint32),
+        ("pad", ctypes.c_uint32),
+        ("ts", ctypes.c_uint64),
+    ]
+
+
+class _Buf(ctypes.Structure):
+    _fields_ = [
+        ("addr", ctypes.c_uint64),
+        ("len", ctypes.c_uint32),
+        ("bid", ctypes.c_uint16),
+        ("resv", ctypes.c_uint16),  # ring tail lives here in entry 0
+    ]
+
+
+class _BufReg(ctypes.Structure):
+    _fields_ = [
+        ("ring_addr", ctypes.c_uint64),
+        ("ring_entries", ctypes.c_uint32),
+        ("bgid", ctypes.c_uint16),
+        ("flags", ctypes.c_uint16),
+        ("resv", ctypes.c_uint64 * 3),
+    ]
+
+
+def kernel_version():
+    """Return the running kernel's (major, minor) version."""
+    release = os.uname().release
+    try:
+        return tuple(int(part) for part in release.split("-")[0].split(".")[:2])
+    except ValueError:
+        return (0, 0)
+
+
+def _timespec(seconds):
+    ts = _KernelTimespec()
+    ts.tv_sec = int(seconds)
+    ts.tv_nsec = int((seconds - int(seconds)) * 1_000_000_000)
+    return ts
+
+
+class Ring:
+    """A single io_uring instance with its submission and completion queues mapped."""
+
+    def __init__(self, entries, flags=0, sq_thread_idle=0, cq_entries=0):
+        if _atomics is None and not _X86:
+            raise OSError(errno.ENOSYS, "libatomic is needed to share io_uring rings safely on this CPU")
+        params = _Params()
+        params.flags = flags
+        if cq_entries:
+            params.flags |= IORING_SETUP_CQSIZE
+            params.cq_entries = cq_entries
+        params.sq_thread_idle = sq_thread_idle  # ms before the SQPOLL thread sleeps
+        self.fd = _syscall(_NR_IO_URING_SETUP, entries, ctypes.addressof(params))
+        self.flags = params.flags
+        self.features = params.features
+        # io_uring_enter() takes a registered ring index instead once
+        # register_ring_fd() has succeeded.
+        self._enter_fd = self.fd
+        self._enter_flags = 0
+        try:
+            self._map(params)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def _map(self, p):
+        sq_size = p.sq_off.array + p.sq_entries * 4
+        cq_size = p.cq_off.cqes + p.cq_entries * ctypes.sizeof(_CQE)
+        if self.features & IORING_FEAT_SINGLE_MMAP:
+            sq_size = cq_size = max(sq_size, cq_size)
+        prot = mmap.PROT_READ | mmap.PROT_WRITE
+        flags = mmap.MAP_SHARED | mmap.MAP_POPULATE
+        self._sq_mm = mmap.mmap(self.fd, sq_size, flags, prot, offset=IORING_OFF_SQ_RING)
+        if self.features & IORING_FEAT_SINGLE_MMAP:
+            self._cq_mm = self._sq_mm
+        else:
+            self._cq_mm = mmap.mmap(self.fd, cq_size, flags, prot, offset=IORING_OFF_CQ_RING)
+        self._sqe_mm = mmap.mmap(self.fd, p.sq_entries * ctypes.sizeof(_SQE), flags, prot,
+                                 offset=IORING_OFF_SQES)
+
+        sq, cq = self._sq_mm, self._cq_mm
+        self.sq_entries = p.sq_entries
+        self._sq_head = ctypes.c_uint32.from_buffer(sq, p.sq_off.head)
+        self._sq_tail = ctypes.c_uint32.from_buffer(sq, p.sq_off.tail)
+        self._sq_flags = ctypes.c_uint32.from_buffer(sq, p.sq_off.flags)
+        self._sq_mask = ctypes.c_uint32.from_buffer(sq, p.sq_off.ring_mask).value
+        self._sqes = (_SQE * p.sq_entries).from_buffer(self._sqe_mm)
+        # Map every ring slot to the SQE with the same index, once.
+        array = (ctypes.c_uint32 * p.sq_entries).from_buffer(sq, p.sq_off.array)
+        for i in range(p.sq_entries):
+            array[i] = i
+        del array
+        self._sq_local_tail = self._sq_tail.value
+
+        self._cq_head = ctypes.c_uint32.from_buffer(cq, p.cq_off.head)
+        self._cq_tail = ctypes.c_uint32.from_buffer(cq, p.cq_off.tail)
+        self._cq_mask = ctypes.c_uint32.from_buffer(cq, p.cq_off.ring_mask).value
+        self._cqes = (_CQE * p.cq_entries).from_buffer(cq, p.cq_off.cqes)
+
+    def get_sqe(self):
+        """Return a zeroed SQE to fill in, or None if the submission queue is full."""
+        # Acquire, so the kernel is done reading a slot before it is reused.
+        if (self._sq_local_tail - _load_acquire(self._sq_head)) & _U32 >= self.sq_entries:
+            return None
+        sqe = self._sqes[self._sq_local_tail & self._sq_mask]
+        ctypes.memset(ctypes.addressof(sqe), 0, ctypes.sizeof(_SQE))
+        self._sq_local_tail = (self._sq_local_tail + 1) & _U32
+        return sqe
+
+    @property
+    def pending(self):
+        """Number of SQEs queued but not yet handed to the kernel."""
+        return (self._sq_local_tail - self._sq_tail.value) & _U32
+
+    def submit(self, wait_nr=0, timeout=None):
+        """
+        Publish queued SQEs to the kernel and optionally wait for completions.
+
+        Returns False if `timeout` seconds passed before `wait_nr` completions arrived.
+        """
+        to_submit = self.pending
+        flags = IORING_ENTER_GETEVENTS if wait_nr else 0
+        if self.flags & IORING_SETUP_SQPOLL:
+            # The SQE fields must be visible before the new tail. The poller
+            # may read the tail at any moment, and the wakeup flag must be
+            # read after the tail is stored, hence a full (seq_cst) ordering.
+            _store_release(self._sq_tail, self._sq_local_tail, _ATOMIC_SEQ_CST)
+            # The kernel thread picks up new entries by itself unless it went idle.
+            if to_submit and _load_acquire(self._sq_flags, _ATOMIC_SEQ_CST) & IORING_SQ_NEED_WAKEUP:
+                flags |= IORING_ENTER_SQ_WAKEUP
+            elif not wait_nr:
+                return True
+        else:
+            _store_release(self._sq_tail, self._sq_local_tail)
+        arg, argsz = 0, 0
+        if wait_nr and timeout is not None:
+            ts = _timespec(timeout)
+            ext = _GeteventsArg(ts=ctypes.addressof(ts))
+            flags |= IORING_ENTER_EXT_ARG
+            arg, argsz = ctypes.addressof(ext), ctypes.sizeof(ext)
+        flags |= self._enter_flags
+        try:
+            _syscall(_NR_IO_URING_ENTER, self._enter_fd, to_submit, wait_nr, flags, arg, argsz)
+        except OSError as e:
+            if e.errno in (errno.ETIME, errno.EINTR):
+                return False
+            raise
+        return True
+
+    def wait_sq_space(self):
+        """Under SQPOLL, block until the kernel thread has freed a submission slot."""
+        flags = IORING_ENTER_SQ_WAIT | self._enter_flags
+        # A sleeping poller would never free one, so wake it as submit() does.
+        if _load_acquire(self._sq_flags, _ATOMIC_SEQ_CST) & IORING_SQ_NEED_WAKEUP:
+            flags |= IORING_ENTER_SQ_WAKEUP
+        try:
+            _syscall(_NR_IO_URING_ENTER, self._enter_fd, 0, 0, flags, 0, 0)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+    def reap(self):
+        """Consume all available completions as a list of (user_data, res, flags)."""
+        # Acquire the tail so the CQEs before it are read after it, and
+        # release the head so they are read before the kernel reuses them.
+        head, tail = self._cq_head.value, _load_acquire(self._cq_tail)
+        completions = []
+        while head != tail:
+            cqe = self._cqes[head & self._cq_mask]
+            completions.append((cqe.user_data, cqe.res, cqe.flags))
+            head = (head + 1) & _U32
+        _store_release(self._cq_head, head)
+        return completions
+
+    def register_ring_fd(self):
+        """
+        Register the ring's own fd so io_uring_enter() skips looking it up.
+
+        Registered ring fds belong to the calling thread, so this must be
+        called from the thread that submits. Returns False, leaving the
+        plain fd in use, on kernels older than 5.18.
+        """
+        update = _RsrcUpdate(offset=_U32, data=self.fd)  # any free slot
+        try:
+            self.register(IORING_REGISTER_RING_FDS, ctypes.addressof(update), 1)
+        except OSError as e:
+            if e.errno == errno.EINVAL:
+                return False
+            raise
+        self._enter_fd = update.offset
+        self._enter_flags = IORING_ENTER_REGISTERED_RING
+        return True
+
+    def register(self, opcode, arg, nr_args):
+        return _syscall(_NR_IO_URING_REGISTER, self.fd, opcode, arg, nr_args)
+
+    def supports(self, opcode):
+        """Whether the running kernel implements `opcode`."""
+        probe = _Probe()
+        self.register(IORING_REGISTER_PROBE, ctypes.addressof(probe), len(probe.ops))
+        return opcode <= probe.last_op and bool(probe.ops[opcode].flags & _IO_URING_OP_SUPPORTED)
+
+    def close(self):
+        # Views into the mappings must go before the mappings can be closed.
+        self._sq_head = self._sq_tail = self._sq_flags = self._sqes = None
+        self._cq_head = self._cq_tail = self._cqes = None
+        for mm in {id(m): m for m in (self._sq_mm, self._cq_mm, self._sqe_mm)}.values():
+            mm.close()
+        if self._enter_flags & IORING_ENTER_REGISTERED_RING:
+            # The registration holds its own reference to the ring.
+            update = _RsrcUpdate(offset=self._enter_fd)
+            self.register(IORING_UNREGISTER_RING_FDS, ctypes.addressof(update), 1)
+        os.close(self.fd)
+
+
+class BufferRing:
+    """
+    Provided buffers the kernel picks from when a read completes (buffer group `bgid`).
+
+    All buffers are slices of one anonymous mapping, so the kernel reads
+    straight into memory that stays put for the life of the ring.
+    """
+
+    def __init__(self, ring, buf_size, num_bufs, bgid=0):
+        self.bgid = bgid
+        self.buf_size = buf_size
+        self.region = mmap.mmap(-1, num_bufs * buf_size)
+        self.view = memoryview(self.region)
+        self._base = ctypes.addressof(ctypes.c_char.from_buffer(self.region))
+        self._mask = num_bufs - 1
+        self._mm = mmap.mmap(-1, num_bufs * ctypes.sizeof(_Buf))
+        self._entries = (_Buf * num_bufs).from_buffer(self._mm)
+        self._tail_field = ctypes.c_uint16.from_buffer(self._mm, _Buf.resv.offset)
+        self._tail = 0
+
+        reg = _BufReg(ring_addr=ctypes.addressof(self._entries), ring_entries=num_bufs, bgid=bgid)
+        ring.register(IORING_REGISTER_PBUF_RING, ctypes.addressof(reg), 1)
+        for bid in range(num_bufs):
+            self.add(bid)
+        self.advance()
+
+    def get(self, bid, length):
+        """View of the first `length` bytes the kernel placed in buffer `bid`."""
+        start = bid * self.buf_size
+        return self.view[start:start + length]
+
+    def add(self, bid):
+        entry = self._entries[self._tail & self._mask]
+        entry.addr = self._base + bid * self.buf_size
+        entry.len = self.buf_size
+        entry.bid = bid
+        self._tail += 1
+
+    def advance(self):
+        """Hand every buffer added since the last call back to the kernel."""
+        # Release, so the entries written by add() are seen before the tail.
+        _store_release(self._tail_field, self._tail & 0xFFFF)
+
+    def close(self):
+        self._entries = self._tail_field = None
+        self._mm.close()
+        try:
+            self.view.release()
+            self.region.close()
+        except BufferError:
+            pass  # a caller still holds a chunk; unmapped once it is dropped
+
+
+# user_data tags; timeouts also carry a generation above the low byte.
+_READ = 1
+_CANCEL = 2
+_TIMEOUT = 3
+_TIMEOUT_REMOVE = 4
+_WRITE = 5  # write sequence number above the low byte
+
+
+class PrinterRing:
+    """
+    Reads the printer device with one multishot read.
+
+    A single submission keeps producing completions as data arrives, each one
+    naming the provided buffer the kernel filled. Kernels without multishot
+    reads get one plain read at a time instead (several in flight could
+    complete out of order on a stream device), re-armed with the next wait.
+
+    Job boundaries come from an IORING_OP_TIMEOUT that is restarted whenever
+    data arrives, so poll() only wakes up for data or an idle printer.
+
+    Saved jobs can be written through the same ring with write_file(); their
+    completions are handled by poll() alongside the reads.
+
+    A block device (e.g. a loop device standing in for the gadget) is read
+    with O_DIRECT at explicit offsets, on a ring that polls for completions
+    (IORING_SETUP_IOPOLL) if the device supports it. Such a ring can't
+    time out, cancel or write to buffered files, but there is nothing to
+    wait for on a block device either: it is read straight through to EOF.
+    """
+
+    def __init__(self, dev_path, buf_size, num_bufs=256, idle_timeout=3.0, sq_thread_idle=2000):
+        if kernel_version() < MIN_KERNEL:
+            raise OSError(errno.ENOSYS, "kernel %d.%d is too old for io_uring capture" % kernel_version())
+        self.eof = False
+        self._armed = False
+        self._lent = []
+        # Read by the kernel when it picks up the SQE, which may be later
+        # under SQPOLL, so it lives as long as the ring.
+        self._idle_ts = _timespec(idle_timeout)
+        self._timeout_gen = 0
+        self._timeout_armed = False
+        self._writes = {}  # sequence -> in-flight write
+        self._write_seq = 0
+        self._buf_size = buf_size
+        self._num_bufs = num_bufs
+        self._sq_thread_idle = sq_thread_idle
+        self.block = stat.S_ISBLK(os.stat(dev_path).st_mode)
+        self.iopoll = self.block
+        self._offset = 0  # next read position on a block device
+        if self.block:
+            # Polled completions need direct I/O; the ring's buffers are
+            # page aligned.
+            self.dev_fd = os.open(dev_path, os.O_RDONLY | os.O_DIRECT)
+        else:
+            # Character devices without native nowait support only take part
+            # in poll-driven retries when opened non-blocking.
+            self.dev_fd = os.open(dev_path, os.O_RDONLY | os.O_NONBLOCK)
+        self.ring = self.bufs = None
+        try:
+            self._setup()
+        except Exception:
+            self.close()
+            raise
+        self._arm_read()
+
+    def _open_ring(self, flags):
+        # Room for a completion per buffer plus the odd control entry.
+        cq_entries = 2 * max(self._num_bufs, BATCH_SIZE)
+        try:
+            # A kernel thread polls the submission queue, so queueing work
+            # needs no io_uring_enter() while it is awake.
+            return Ring(BATCH_SIZE, flags | IORING_SETUP_SQPOLL, self._sq_thread_idle, cq_entries)
+        except PermissionError:
+            return Ring(BATCH_SIZE, flags, cq_entries=cq_entries)
+
+    def _setup(self):
+        if self.iopoll:
+            try:
+                self.ring = self._open_ring(IORING_SETUP_IOPOLL)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                self.iopoll = False
+        if not self.iopoll:
+            self.ring = self._open_ring(0)
+        if not self.ring.features & IORING_FEAT_EXT_ARG:
+            raise OSError(errno.ENOSYS, "io_uring wait timeouts not supported")
+        # Block devices can't be polled for readiness, which multishot needs.
+        self.multishot = not self.block and self.ring.supports(IORING_OP_READ_MULTISHOT)
+        # Every wait for data goes through io_uring_enter(), so skip its
+        # fd lookup too where the kernel allows.
+        self.ring.register_ring_fd()
+        # Refer to the device by its registered index so submissions skip
+        # the per-operation file lookup.
+        fds = (ctypes.c_int32 * 1)(self.dev_fd)
+        self.ring.register(IORING_REGISTER_FILES, ctypes.addressof(fds), 1)
+        self.bufs = BufferRing(self.ring, self._buf_size, self._num_bufs)
+
+    def _disable_iopoll(self):
+        """Rebuild the ring without IOPOLL once the device turns out not to support it."""
+        self.bufs.close()
+        self.ring.close()
+        self.ring = self.bufs = None
+        self._lent = []
+        self.iopoll = False
+        self._setup()
+
+    def _get_sqe(self):
+        if self.ring.pending >= BATCH_SIZE:
+            self.ring.submit()
+        sqe = self.ring.get_sqe()
+        if sqe is None:  # the kernel hasn't consumed the last batch yet
+            self.ring.submit()
+            sqe = self.ring.get_sqe()
+        # submit() doesn't enter the kernel under SQPOLL, so the poller may
+        # still be working through the queue.
+        while sqe is None and self.ring.flags & IORING_SETUP_SQPOLL:
+            self.ring.wait_sq_space()
+            sqe = self.ring.get_sqe()
+        if sqe is None:
+            raise OSError(errno.EBUSY, "io_uring submission queue is full")
+        return sqe
+
+    def _arm_read(self):
+        sqe = self._get_sqe()
+        if self.multishot:
+            sqe.opcode = IORING_OP_READ_MULTISHOT
+        else:
+            sqe.opcode = IORING_OP_READ
+            sqe.len = self.bufs.buf_size
+        sqe.fd = 0  # index into the registered files
+        # Read at the current position, or straight through a block device
+        sqe.off = self._offset if self.block else 2 ** 64 - 1
+        sqe.flags = IOSQE_FIXED_FILE | IOSQE_BUFFER_SELECT
+        sqe.buf_index = self.bufs.bgid
+        sqe.user_data = _READ
+        self._armed = True
+
+    def _restart_idle_timeout(self):
+        if self.iopoll:
+            return  # polled rings don't support timeouts
+        if self._timeout_armed:
+            sqe = self._get_sqe()
+            sqe.opcode = IORING_OP_TIMEOUT_REMOVE
+            sqe.addr = self._timeout_gen << 8 | _TIMEOUT
+            sqe.user_data = _TIMEOUT_REMOVE
+        self._timeout_gen += 1
+        sqe = self._get_sqe()
+        sqe.opcode = IORING_OP_TIMEOUT
+        sqe.addr = ctypes.addressof(self._idle_ts)
+        sqe.len = 1
+        sqe.user_data = self._timeout_gen << 8 | _TIMEOUT
+        self._timeout_armed = True
+
+    def write_file(self, path, data, done=None):
+        """
+        Start writing `data` to a new file at `path` and return without
+        waiting for it.
+
+        `data` must be a writable buffer (e.g. a bytearray) left untouched
+        until `done(error)` is called from poll() or close(), with None or
+        the OSError. Returns False, having written nothing, when MAX_WRITES
+        are already in flight or the ring polls a block device (polled
+        rings can only do direct I/O).
+        """
+        if self.iopoll or len(self._writes) >= MAX_WRITES:
+            return False
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self._write_seq += 1
+        # Exporting the buffer keeps a bytearray from being resized under the kernel.
+        buf = (ctypes.c_char * len(data)).from_buffer(data)
+        self._writes[self._write_seq] = [fd, buf, 0, done]
+        self._queue_write(self._write_seq)
+        self.ring.submit()  # start it now rather than with the next wait
+        return True
+
+    def _queue_write(self, seq):
+        fd, buf, offset, _ = self._writes[seq]
+        sqe = self._get_sqe()
+        sqe.opcode = IORING_OP_WRITE
+        sqe.fd = fd
+        sqe.off = offset
+        sqe.addr = ctypes.addressof(buf) + offset
+        sqe.len = len(buf) - offset
+        sqe.user_data = seq << 8 | _WRITE
+
+    def _write_done(self, seq, res):
+        write = self._writes[seq]
+        fd, buf, offset, done = write
+        if res > 0 and offset + res < len(buf):
+            write[2] = offset + res  # short write; queue the rest
+            self._queue_write(seq)
+            return
+        del self._writes[seq]
+        os.close(fd)
+        error = OSError(-res, os.strerror(-res)) if res < 0 else None
+        if done:
+            done(error)
+
+    def _drain_writes(self):
+        while self._writes:
+            self.ring.submit(wait_nr=1)
+            for user_data, res, flags in self.ring.reap():
+                if user_data & 0xFF == _WRITE:
+                    self._write_done(user_data >> 8, res)
+                elif user_data == _READ and not flags & IORING_CQE_F_MORE:
+                    self._armed = False
+
+    def poll(self):
+        """
+        Wait for printer data.
+
+        Returns a list of memoryviews (valid until the next call), an empty
+        list once no data has arrived for `idle_timeout` seconds, or None
+        once the device has closed.
+        """
+        for bid in self._lent:
+            self.bufs.add(bid)
+        if self._lent:
+            self.bufs.advance()
+            self._lent = []
+
+        while not self.eof:
+            if not self._armed:
+                self._arm_read()
+            self.ring.submit(wait_nr=1)
+            try:
+                chunks, idle = self._reap()
+            except OSError as e:
+                if not (self.iopoll and e.errno == errno.EOPNOTSUPP):
+                    raise
+                self._disable_iopoll()
+                continue
+            if chunks:
+                self._restart_idle_timeout()
+                return chunks
+            if idle:
+                return chunks
+            # Otherwise only a write, a stale timeout or bookkeeping completion came in.
+        return None
+
+    def _reap(self):
+        chunks = []
+        idle = False
+        for user_data, res, flags in self.ring.reap():
+            if user_data & 0xFF == _TIMEOUT:
+                if user_data == self._timeout_gen << 8 | _TIMEOUT:
+                    self._timeout_armed = False
+                    idle = res == -errno.ETIME
+                continue
+            if user_data & 0xFF == _WRITE:
+                self._write_done(user_data >> 8, res)
+                continue
+            if user_data != _READ:
+                continue
+            if res > 0:
+                bid = flags >> IORING_CQE_BUFFER_SHIFT
+                chunks.append(self.bufs.get(bid, res))
+                self._lent.append(bid)
+                self._offset += res
+            if not flags & IORING_CQE_F_MORE:
+                self._armed = False
+                if res == 0:
+                    self.eof = True
+                elif res < 0 and res != -errno.ENOBUFS:
+                    raise OSError(-res, os.strerror(-res))
+        return chunks, idle
+
+    def _cancel_read(self):
+        if not self.iopoll:  # a polled block read just completes
+            sqe = self._get_sqe()
+            sqe.opcode = IORING_OP_ASYNC_CANCEL
+            sqe.addr = _READ
+            sqe.user_data = _CANCEL
+        # The kernel must be done with our buffers before they are freed.
+        while self._armed:
+            if not self.ring.submit(wait_nr=1, timeout=1.0):
+                break
+            for user_data, res, flags in self.ring.reap():
+                if user_data == _READ and not flags & IORING_CQE_F_MORE:
+                    self._armed = False
+
+    def close(self):
+        if self.ring:
+            # Job buffers must outlive the writes reading from them.
+            self._drain_writes()
+            if self._armed:
+                self._cancel_read()
+            if self.bufs:
+                self.bufs.close()
+            self.ring.close()
+        os.close(self.dev_fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -3,6 +3,39 @@
 ESC/POS format converter for thermal printer data.
 Handles binary data with ESC/POS control codes and extracts printable text.
 """
+import re
+
+# Common ESC/POS control codes to remove or handle. Line feeds stay as they
+# are and carriage returns go with the other control characters below.
+_ESCPOS_REPLACEMENTS = {
+    # Cursor and line control
+    b'\x1B\x64': b'\n',  # Print and feed line
+    
+    # Cutter commands
+    b'\x1D\x56\x41\x00': b'\n--- CUT ---\n',  # Full cut
+    b'\x1D\x56\x42\x00': b'\n--- CUT ---\n',  # Partial cut
+}
+_ESCPOS_REMOVALS = [
+    # Text formatting
+    b'\x1B\x21\x00',  # Normal text
+    b'\x1B\x21\x01',  # Bold on
+    b'\x1B\x21\x10',  # Double height
+    b'\x1B\x21\x20',  # Double width
+    
+    # Alignment
+    b'\x1B\x61\x00',  # Left align
+    b'\x1B\x61\x01',  # Center align
+    b'\x1B\x61\x02',  # Right align
+]
+# Every removal in one pass. The replacement is a constant, so re.sub never
+# calls back into Python per match; the few codes that produce text stay as
+# bytes.replace, which is as fast per pass.
+_ESCPOS_REMOVE_RE = re.compile(b'|'.join(re.escape(code) for code in _ESCPOS_REMOVALS))
+
+# Printable ASCII, tabs and line feeds are kept, as is Latin-1 text
+# (0xA0-0xFF); C1 controls (0x80-0x9F) become '?'.
+_C1_TABLE = bytes(ord('?') if 0x80 <= b <= 0x9F else b for b in range(256))
+_DELETE = bytes(b for b in range(0x80) if not (32 <= b <= 126 or b in (9, 10)))
 
 def convert_escpos(bin_data):
     """
@@ -15,47 +48,15 @@ def convert_escpos(bin_data):
         str: Extracted text with control codes removed
     """
     try:
-        # Common ESC/POS control codes to remove or handle
-        control_codes = {
-            # Cursor and line control
-            b'\x0A': '\n',  # Line Feed
-            b'\x0D': '',     # Carriage Return
-            b'\x1B\x64': '\n',  # Print and feed line
-            
-            # Text formatting
-            b'\x1B\x21\x00': '',  # Normal text
-            b'\x1B\x21\x01': '',  # Bold on
-            b'\x1B\x21\x10': '',  # Double height
-            b'\x1B\x21\x20': '',  # Double width
-            
-            # Alignment
-            b'\x1B\x61\x00': '',  # Left align
-            b'\x1B\x61\x01': '',  # Center align
-            b'\x1B\x61\x02': '',  # Right align
-            
-            # Cutter commands
-            b'\x1D\x56\x41\x00': '\n--- CUT ---\n',  # Full cut
-            b'\x1D\x56\x42\x00': '\n--- CUT ---\n',  # Partial cut
-        }
-        
-        # Initialize result
-        text = bin_data.decode('latin-1', errors='replace')
-        
         # Replace control codes
-        for code, replacement in control_codes.items():
-            text = text.replace(code.decode('latin-1', errors='ignore'), replacement)
+        data = _ESCPOS_REMOVE_RE.sub(b'', bin_data)
+        for code, replacement in _ESCPOS_REPLACEMENTS.items():
+            data = data.replace(code, replacement)
             
-        # Remove other control characters (0x00-0x1F, 0x7F-0x9F) except newlines and tabs
-        cleaned = []
-        for char in text:
-            code = ord(char)
-            if (32 <= code <= 126) or (code in (9, 10, 13)):
-                cleaned.append(char)
-            elif code > 127:
-                # Try to handle extended ASCII
-                cleaned.append(char if 160 <= code <= 255 else '?')
-                
-        return ''.join(cleaned)
+        # Remove other control characters (0x00-0x1F, 0x7F), carriage
+        # returns included, except newlines and tabs and mark C1 controls,
+        # in one pass
+        return data.translate(_C1_TABLE, _DELETE).decode('latin-1')
         
     except Exception as e:
         return f"[ERROR] ESC/POS conversion failed: {str(e)}"
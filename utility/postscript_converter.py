@@ -7,6 +7,11 @@ and other common PostScript text patterns.
 import re
 from pathlib import Path
 
+# Text between parentheses (common in PostScript)
+_PAREN_RE = re.compile(r'\((?:\\.|[^\\()])*\)')
+# Common PostScript text commands
+_PS_TEXT_RE = re.compile(r'\bT[adf]?\s*[\(]([^)]+)[\)]')
+
 def convert_postscript(input_path):
     """
     Convert PostScript binary data to readable text.
@@ -23,7 +28,7 @@ def convert_postscript(input_path):
             content = f.read().decode('latin-1')
         
         # Extract text between parentheses (common in PostScript)
-        text_pieces = re.findall(r'\((?:\\.|[^\\()])*\)', content)
+        text_pieces = _PAREN_RE.findall(content)
         
         # Clean up the extracted text
         cleaned_text = []
@@ -35,7 +40,7 @@ def convert_postscript(input_path):
                 cleaned_text.append(text)
         
         # Also look for common PostScript text commands
-        ps_text = re.findall(r'\bT[adf]?\s*[\(]([^)]+)[\)]', content)
+        ps_text = _PS_TEXT_RE.findall(content)
         cleaned_text.extend(ps_text)
         
         # Join all text pieces with newlines
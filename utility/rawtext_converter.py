@@ -3,8 +3,12 @@
 Raw Text Converter for printer data.
 Handles simple ASCII/UTF-8 text files by removing non-printable characters.
 """
-import re
-from pathlib import Path
+
+# Bytes str.splitlines() breaks lines on, all mapped to \n
+_LINE_BREAKS = b'\r\v\f\x1c\x1d\x1e'
+_BREAK_TABLE = bytes.maketrans(_LINE_BREAKS, b'\n' * len(_LINE_BREAKS))
+# Everything but ASCII 32-126, tabs and line breaks (deletion happens first)
+_DELETE = bytes(b for b in range(256) if not (32 <= b <= 126 or b in b'\t\n' + _LINE_BREAKS))
 
 def convert_rawtext(input_path):
     """
@@ -17,24 +21,26 @@ def convert_rawtext(input_path):
         str: Cleaned text content
     """
     try:
-        # Try UTF-8 first, fall back to Latin-1 if that fails
+        with open(input_path, 'rb') as f:
+            content = f.read()
+        
+        # Non-ASCII characters are dropped below, but the ones that break
+        # lines still do: NEL, LS and PS if the file is UTF-8, otherwise NEL
+        # as read in Latin-1
         try:
-            with open(input_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content.decode('utf-8')
+            non_ascii_breaks = (b'\xc2\x85', b'\xe2\x80\xa8', b'\xe2\x80\xa9')
         except UnicodeDecodeError:
-            with open(input_path, 'r', encoding='latin-1') as f:
-                content = f.read()
+            non_ascii_breaks = (b'\x85',)
+        for line_break in non_ascii_breaks:
+            content = content.replace(line_break, b'\n')
         
         # Remove non-printable characters except newlines and tabs
         # This keeps standard ASCII 32-126, plus newlines and tabs
-        cleaned = []
-        for line in content.splitlines():
-            # Remove non-printable chars from each line
-            clean_line = ''.join(char for char in line if 32 <= ord(char) <= 126 or char in '\t\n\r')
-            if clean_line.strip():  # Only keep non-empty lines
-                cleaned.append(clean_line)
+        content = content.translate(_BREAK_TABLE, _DELETE)
+        cleaned = [line for line in content.split(b'\n') if line.strip()]  # Only keep non-empty lines
         
-        return '\n'.join(cleaned) if cleaned else "No readable text content found."
+        return b'\n'.join(cleaned).decode('ascii') if cleaned else "No readable text content found."
         
     except Exception as e:
         return f"Error processing raw text data: {str(e)}"